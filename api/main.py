@@ -5,16 +5,22 @@ Provides a REST API endpoint for asking questions about Vasco da Gama.
 
 Endpoints:
 - POST /ask: Submit a question and receive an answer with sources
+- POST /ask/batch: Submit several questions and receive one answer per question
+- POST /ask/stream: Submit a question and receive the answer as it is generated
 - GET /health: Health check endpoint
 """
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Annotated, List, Optional, Set, Tuple
+import asyncio
 import logging
+import orjson
+import os
 
-from api.query import VascoRAG
+from api.query import OLLAMA_NUM_PARALLEL, AskResult, VascoRAG
 
 
 # Configure logging
@@ -24,6 +30,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Dynamic batching of concurrent /ask requests
+BATCH_MAX_SIZE = 8  # Max questions coalesced into one batch
+BATCH_MAX_WAIT = 0.02  # Seconds to wait for more questions after the first
+MAX_BATCH_QUESTIONS = 32  # Max questions accepted by /ask/batch
+
+# Number of uvicorn worker processes; each one loads its own RAG system.
+# uvicorn takes its default --workers from WEB_CONCURRENCY, so use that too.
+_API_WORKERS_ENV = os.getenv("API_WORKERS") or os.getenv("WEB_CONCURRENCY")
+API_WORKERS = int(_API_WORKERS_ENV or "1")
+if API_WORKERS <= 0:
+    raise ValueError(f"API_WORKERS must be a positive integer, got {API_WORKERS}")
+
 
 # Pydantic models for request/response validation
 class QuestionRequest(BaseModel):
@@ -49,6 +67,25 @@ class AnswerResponse(BaseModel):
     )
 
 
+class BatchQuestionRequest(BaseModel):
+    """Request model for asking several questions at once."""
+    questions: List[Annotated[str, Field(min_length=1, max_length=500)]] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BATCH_QUESTIONS,
+        description="Questions about Vasco da Gama",
+        examples=[["Quando o Vasco foi fundado?", "Quais são as cores do Vasco?"]]
+    )
+
+
+class BatchAnswerResponse(BaseModel):
+    """Response model with one answer per question, in request order."""
+    results: List[AnswerResponse] = Field(
+        ...,
+        description="Answers and sources for each question"
+    )
+
+
 class HealthResponse(BaseModel):
     """Health check response."""
     status: str
@@ -74,21 +111,151 @@ app.add_middleware(
 )
 
 
+class QuestionBatcher:
+    """
+    Coalesces concurrent questions into VascoRAG.ask_batch calls.
+    
+    Questions are queued by request handlers. A background task collects up
+    to max_batch_size of them, waiting at most max_wait seconds after the
+    first, and answers them together so embedding and vector search run
+    once per batch instead of once per request.
+    """
+    
+    def __init__(
+        self,
+        rag: VascoRAG,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait: float = BATCH_MAX_WAIT
+    ):
+        self.rag = rag
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._collector: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+    
+    def start(self) -> None:
+        """Start collecting batches on the running event loop."""
+        self._collector = asyncio.create_task(self._collect())
+    
+    async def stop(self) -> None:
+        """Stop collecting batches and wait for in-flight ones."""
+        if self._collector is not None:
+            self._collector.cancel()
+            await asyncio.gather(self._collector, return_exceptions=True)
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+    
+    async def ask(self, question: str) -> AskResult:
+        """Queue a question and wait for its answer."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((question, future))
+        return await future
+    
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Answer in the background so the next batch can start collecting
+            task = asyncio.create_task(self._answer(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+    
+    async def _answer(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Questions only share a batch by timing, so one failed generation
+        # must not fail the others
+        try:
+            results = await self.rag.ask_batch(
+                [question for question, _ in batch],
+                return_exceptions=True
+            )
+        except Exception as e:
+            # Embedding or retrieval failed for the whole batch
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
 # Initialize RAG system (singleton pattern)
-rag_system = None
+rag_system: Optional[VascoRAG] = None
+question_batcher: Optional[QuestionBatcher] = None
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize RAG system on startup."""
-    global rag_system
+    global rag_system, question_batcher
+    
+    # Split the cores between workers to avoid oversubscribing them
+    if _API_WORKERS_ENV is None:
+        logger.warning(
+            "API_WORKERS is not set; assuming a single worker process. "
+            "When running several uvicorn workers, set API_WORKERS to the "
+            "worker count so they do not all use every CPU core."
+        )
+    num_threads = max(1, (os.cpu_count() or 1) // API_WORKERS)
+    
+    # Split Ollama's parallel slots between workers the same way, so all
+    # workers together stay within OLLAMA_NUM_PARALLEL
+    if API_WORKERS > OLLAMA_NUM_PARALLEL:
+        logger.warning(
+            f"{API_WORKERS} workers but OLLAMA_NUM_PARALLEL={OLLAMA_NUM_PARALLEL}; "
+            "each worker still sends one generation at a time, so Ollama "
+            "may queue requests"
+        )
+    ollama_parallel = max(1, OLLAMA_NUM_PARALLEL // API_WORKERS)
+    
     try:
-        logger.info("Initializing RAG system...")
-        rag_system = VascoRAG()
+        logger.info(
+            f"Initializing RAG system with {num_threads} threads and "
+            f"{ollama_parallel} Ollama slots..."
+        )
+        rag_system = VascoRAG(
+            num_threads=num_threads,
+            ollama_parallel=ollama_parallel
+        )
+        question_batcher = QuestionBatcher(rag_system)
+        question_batcher.start()
         logger.info("RAG system initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize RAG system: {e}")
         raise
+    
+    try:
+        logger.info(f"Loading Ollama model '{rag_system.ollama_model}'...")
+        await rag_system.warmup_ollama()
+        logger.info("Ollama model loaded")
+    except Exception as e:
+        # Not fatal: Ollama may be started after the API
+        logger.warning(f"Could not preload Ollama model: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release RAG system resources on shutdown."""
+    if question_batcher is not None:
+        await question_batcher.stop()
+    if rag_system is not None:
+        await rag_system.aclose()
 
 
 @app.get("/", response_model=dict)
@@ -99,6 +266,8 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "ask": "POST /ask",
+            "ask_batch": "POST /ask/batch",
+            "ask_stream": "POST /ask/stream",
             "health": "GET /health",
             "docs": "GET /docs"
         }
@@ -129,6 +298,8 @@ async def ask_question(request: QuestionRequest):
     """
     Ask a question about Vasco da Gama.
     
+    Concurrent requests are coalesced into small batches before retrieval.
+    
     This endpoint:
     1. Retrieves relevant context from the vector store
     2. Constructs a strict prompt
@@ -144,7 +315,7 @@ async def ask_question(request: QuestionRequest):
     Raises:
         HTTPException: If RAG system is not initialized or an error occurs
     """
-    if rag_system is None:
+    if rag_system is None or question_batcher is None:
         raise HTTPException(
             status_code=503,
             detail="RAG system not initialized"
@@ -154,7 +325,7 @@ async def ask_question(request: QuestionRequest):
         logger.info(f"Received question: {request.question}")
         
         # Process the question through RAG
-        result = rag_system.ask(request.question)
+        result = await question_batcher.ask(request.question)
         
         logger.info(f"Generated answer with {len(result['sources'])} sources")
         
@@ -163,34 +334,138 @@ async def ask_question(request: QuestionRequest):
             sources=result["sources"]
         )
         
-    except ConnectionError as e:
-        logger.error(f"Ollama connection error: {e}")
+    except Exception as e:
+        raise _http_error(e)
+
+
+@app.post("/ask/batch", response_model=BatchAnswerResponse)
+async def ask_questions(request: BatchQuestionRequest):
+    """
+    Ask several questions about Vasco da Gama in one request.
+    
+    The questions share one embedding pass and one vector search; the
+    answers are generated concurrently.
+    
+    Args:
+        request: BatchQuestionRequest with the user's questions
+        
+    Returns:
+        BatchAnswerResponse with one answer per question, in order
+        
+    Raises:
+        HTTPException: If RAG system is not initialized or an error occurs
+    """
+    if rag_system is None:
         raise HTTPException(
             status_code=503,
-            detail=str(e)
+            detail="RAG system not initialized"
         )
-    except ValueError as e:
-        logger.error(f"Configuration error: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=str(e)
+    
+    try:
+        logger.info(f"Received {len(request.questions)} questions")
+        
+        results = await rag_system.ask_batch(request.questions)
+        
+        return BatchAnswerResponse(
+            results=[
+                AnswerResponse(answer=result["answer"], sources=result["sources"])
+                for result in results
+            ]
         )
+        
     except Exception as e:
-        logger.error(f"Unexpected error: {e}", exc_info=True)
+        raise _http_error(e)
+
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    Ask a question about Vasco da Gama and stream the answer.
+    
+    The response is newline-delimited JSON: a first line with the sources,
+    e.g. {"sources": ["historia.md"]}, followed by lines with pieces of the
+    answer, e.g. {"answer": "O Vasco"}, as Ollama generates them. The last
+    line is {"done": true} when the answer is complete, or
+    {"error": "..."} when generation failed part way through.
+    
+    Args:
+        request: QuestionRequest with the user's question
+        
+    Returns:
+        StreamingResponse with application/x-ndjson content
+        
+    Raises:
+        HTTPException: If RAG system is not initialized or Ollama fails
+            before the answer starts
+    """
+    if rag_system is None:
         raise HTTPException(
+            status_code=503,
+            detail="RAG system not initialized"
+        )
+    
+    logger.info(f"Received streamed question: {request.question}")
+    
+    # Wait for the first event so errors become proper HTTP responses
+    events = rag_system.ask_stream(request.question)
+    try:
+        first = await anext(events)
+    except Exception as e:
+        raise _http_error(e)
+    
+    async def body():
+        yield orjson.dumps(first) + b"\n"
+        try:
+            async for event in events:
+                yield orjson.dumps(event) + b"\n"
+        except Exception as e:
+            # Headers are already sent; report the error in the stream
+            yield orjson.dumps({"error": _http_error(e).detail}) + b"\n"
+            return
+        yield orjson.dumps({"done": True}) + b"\n"
+    
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+def _http_error(e: Exception) -> HTTPException:
+    """Log a RAG error and map it to the matching HTTP error."""
+    if isinstance(e, ConnectionError):
+        logger.error(f"Ollama connection error: {e}")
+        return HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
+    if isinstance(e, ValueError):
+        logger.error(f"Configuration error: {e}")
+        return HTTPException(
             status_code=500,
-            detail="An unexpected error occurred while processing your question"
+            detail=str(e)
         )
+    logger.error(f"Unexpected error: {e}", exc_info=e)
+    return HTTPException(
+        status_code=500,
+        detail="An unexpected error occurred while processing your question"
+    )
 
 
 if __name__ == "__main__":
     import uvicorn
     
+    # DEV=1 runs a single auto-reloading process with access logs;
+    # otherwise one worker per core (or API_WORKERS) without access logs
+    dev = bool(os.getenv("DEV"))
+    workers = 1 if dev else int(os.getenv("API_WORKERS", os.cpu_count() or 1))
+    os.environ["API_WORKERS"] = str(workers)  # Read by each worker process
+    
     # Run the server
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,  # Enable auto-reload during development
+        reload=dev,
+        workers=workers,
+        loop="auto",  # uvloop when installed (uvicorn[standard])
+        http="auto",  # httptools when installed (uvicorn[standard])
+        access_log=dev,
         log_level="info"
     )
@@ -8,22 +8,155 @@ This module handles:
 4. Answer generation with source attribution
 """
 
-from typing import List, Dict, Optional
+from typing import (
+    AsyncGenerator, List, Dict, Literal, Optional, Sequence, TypedDict,
+    Union, overload
+)
+from dataclasses import dataclass
 from pathlib import Path
+import asyncio
+import logging
+import os
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
-import requests
-import json
+import numpy as np
+import torch
+import simsimd
+import httpx
+import orjson
 
 
+logger = logging.getLogger(__name__)
+
 # Configuration
 VECTORSTORE_DIR = Path(__file__).parent.parent / "vectorstore"
 COLLECTION_NAME = "vasco_knowledge"
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = "onnx"  # ONNX Runtime inference; use "torch" for plain PyTorch
 OLLAMA_BASE_URL = "http://localhost:11434"
 OLLAMA_MODEL = "gemma3:1b"  # Default model, can be changed
 TOP_K_RESULTS = 5  # Number of chunks to retrieve
+OLLAMA_TIMEOUT = 60  # Seconds to wait for a generation
+# Generations Ollama serves at once; match the server's OLLAMA_NUM_PARALLEL
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+CACHE_CAPACITY = 256  # Max answered questions kept in the semantic cache
+CACHE_SIMILARITY_THRESHOLD = 0.95  # Cosine similarity needed for a cache hit
+
+# Generation options sent with every Ollama request, serialized once
+_OLLAMA_OPTIONS = orjson.Fragment(orjson.dumps({
+    "temperature": 0.1,  # Low temperature for factual responses
+    "top_p": 0.9,
+    "top_k": 40
+}))
+
+# Fixed parts of the prompt built by VascoRAG.build_prompt
+_PROMPT_PREFIX = """You are a helpful assistant answering questions about Clube de Regatas Vasco da Gama.
+
+CRITICAL INSTRUCTIONS:
+1. You MUST answer ONLY using the context provided below
+2. The context below is AUTHORITATIVE and is the ONLY source of truth
+3. DO NOT use any external knowledge or information you were trained on
+4. DO NOT guess or make assumptions
+5. If the answer is not explicitly present in the context, you MUST respond with "I don't know"
+6. Keep your answers concise and factual
+7. When you provide an answer, cite which source document it came from
+
+CONTEXT:
+"""
+_PROMPT_SUFFIX = """
+
+QUESTION: {question}
+
+ANSWER:"""
+
+
+@dataclass(slots=True, frozen=True)
+class Context:
+    """A retrieved chunk of the knowledge base."""
+    text: str
+    source: str
+
+
+@dataclass(slots=True, frozen=True)
+class _PendingAnswer:
+    """A question that missed the cache and is ready for generation."""
+    question_embedding: np.ndarray
+    prompt: str
+    sources: List[str]
+
+
+class AskResult(TypedDict):
+    """Answer to a question with the documents it was based on."""
+    answer: str
+    sources: List[str]
+
+
+class StreamEvent(TypedDict, total=False):
+    """One event of a streamed answer: the sources, or a piece of the answer."""
+    sources: List[str]
+    answer: str
+
+
+class SemanticCache:
+    """
+    In-memory cache of answers keyed by question embedding.
+    
+    A lookup hits when a cached question has cosine similarity above the
+    threshold with the incoming one, so repeated or near-duplicate questions
+    skip retrieval and generation. Similarities against all cached questions
+    are computed in one SimSIMD call, which dispatches to the widest SIMD
+    kernel the CPU supports. Embeddings are stored quantized to int8, a
+    quarter of the float32 footprint, with negligible effect on cosine
+    similarity for normalized vectors. Once full, the oldest entry is
+    overwritten (ring buffer).
+    """
+    
+    def __init__(
+        self,
+        dim: int,
+        capacity: int = CACHE_CAPACITY,
+        threshold: float = CACHE_SIMILARITY_THRESHOLD
+    ):
+        self.capacity = capacity
+        self.threshold = threshold
+        self._embeddings = np.empty((capacity, dim), dtype=np.int8)
+        self._entries: List[AskResult] = []
+        self._next = 0
+    
+    @staticmethod
+    def _quantize(embedding: np.ndarray) -> np.ndarray:
+        """Map an L2-normalized embedding onto int8."""
+        return np.round(embedding * 127).astype(np.int8)
+    
+    def lookup(self, embedding: np.ndarray) -> Optional[AskResult]:
+        """Return the cached answer for a similar question, if any."""
+        if not self._entries:
+            return None
+        
+        distances = np.asarray(simsimd.cdist(
+            self._quantize(embedding)[np.newaxis, :],
+            self._embeddings[:len(self._entries)],
+            metric="cosine"
+        )).reshape(-1)
+        best = int(np.argmin(distances))
+        if 1.0 - distances[best] <= self.threshold:
+            return None
+        
+        entry = self._entries[best]
+        return {
+            "answer": entry["answer"],
+            "sources": list(entry["sources"])
+        }
+    
+    def store(self, embedding: np.ndarray, entry: AskResult) -> None:
+        """Cache an answer under the question embedding."""
+        self._embeddings[self._next] = self._quantize(embedding)
+        if len(self._entries) < self.capacity:
+            self._entries.append(entry)
+        else:
+            self._entries[self._next] = entry
+        self._next = (self._next + 1) % self.capacity
 
 
 class VascoRAG:
@@ -36,15 +169,61 @@ class VascoRAG:
     - Returns "I don't know" when context is insufficient
     """
     
-    def __init__(self, ollama_model: str = OLLAMA_MODEL):
+    def __init__(
+        self,
+        ollama_model: str = OLLAMA_MODEL,
+        ollama_parallel: int = OLLAMA_NUM_PARALLEL,
+        num_threads: Optional[int] = None
+    ):
         """
         Initialize the RAG system.
         
         Args:
             ollama_model: Name of the Ollama model to use
+            ollama_parallel: Max generations sent to Ollama at once
+            num_threads: CPU threads for embedding inference; defaults to
+                each runtime's own choice (all cores)
         """
         self.ollama_model = ollama_model
-        self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+        
+        # Queue generations beyond what Ollama runs in parallel here, so
+        # they do not spend their read timeout waiting inside Ollama
+        self._ollama_slots = asyncio.Semaphore(ollama_parallel)
+        
+        # Reuse pooled keep-alive connections to Ollama across requests.
+        # The client is async so concurrent questions overlap their LLM I/O.
+        self.http_client = httpx.AsyncClient(
+            base_url=OLLAMA_BASE_URL,
+            headers={"Content-Type": "application/json"},
+            timeout=OLLAMA_TIMEOUT,
+            limits=httpx.Limits(
+                max_keepalive_connections=40,
+                max_connections=100,
+                keepalive_expiry=30
+            )
+        )
+        
+        # Both torch and ONNX Runtime keep their own thread pools, so cap both
+        model_kwargs = {}
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+            if EMBEDDING_BACKEND == "onnx":
+                import onnxruntime
+                
+                session_options = onnxruntime.SessionOptions()
+                session_options.intra_op_num_threads = num_threads
+                model_kwargs["session_options"] = session_options
+        
+        self.embedding_model = SentenceTransformer(
+            EMBEDDING_MODEL,
+            backend=EMBEDDING_BACKEND,
+            model_kwargs=model_kwargs
+        )
+        # Tokenizer called directly on the hot path
+        self._tokenizer = self.embedding_model.tokenizer
+        self.cache = SemanticCache(
+            dim=self.embedding_model.get_sentence_embedding_dimension()
+        )
         
         # Connect to existing ChromaDB
         if not VECTORSTORE_DIR.exists():
@@ -65,42 +244,118 @@ class VascoRAG:
                 f"Collection '{COLLECTION_NAME}' not found. "
                 "Please run the ingestion script first."
             ) from e
+        
+        self._warmup()
     
-    def retrieve_context(self, question: str, top_k: int = TOP_K_RESULTS) -> List[Dict]:
+    def _warmup(self) -> None:
+        """
+        Run dummy embedding and vector search passes.
+        
+        The first forward pass and the first query pay lazy initialization
+        costs (kernel selection, index loading). Paying them here keeps them
+        out of the first user request.
+        """
+        self.embedding_model.eval()
+        embeddings = self.embed_questions(["warmup"] * 4)
+        
+        if self.collection.count() > 0:
+            self.collection.query(
+                query_embeddings=embeddings[:1],
+                n_results=1
+            )
+    
+    def embed_question(self, question: str) -> np.ndarray:
+        """Embed a question as an L2-normalized float32 vector."""
+        return self.embed_questions([question])[0]
+    
+    def embed_questions(self, questions: List[str]) -> np.ndarray:
+        """
+        Embed several questions in one forward pass.
+        
+        Tokenizes directly and runs the loaded SentenceTransformer pipeline
+        instead of SentenceTransformer.encode, which builds a DataLoader and
+        does per-call bookkeeping even for one input. Pooling and any
+        normalization come from the model's own modules, and the result is
+        L2-normalized like the ingested chunk embeddings.
+        
+        torch.inference_mode() only skips autograd for the torch backend;
+        under the ONNX backend the forward pass runs in ONNX Runtime and it
+        has no effect.
+        """
+        with torch.inference_mode():
+            encoded = self._tokenizer(
+                questions,
+                padding=True,
+                truncation=True,
+                max_length=self.embedding_model.max_seq_length,
+                return_tensors="pt"
+            ).to(self.embedding_model.device)
+            embeddings = self.embedding_model(dict(encoded))["sentence_embedding"]
+            embeddings = torch.nn.functional.normalize(embeddings, dim=1)
+        
+        return embeddings.cpu().numpy().astype(np.float32, copy=False)
+    
+    def retrieve_context(
+        self,
+        question: str,
+        top_k: int = TOP_K_RESULTS,
+        question_embedding: Optional[np.ndarray] = None
+    ) -> List[Context]:
         """
         Retrieve relevant context chunks for a question.
         
         Args:
             question: User's question
             top_k: Number of top results to retrieve
+            question_embedding: Precomputed embedding of the question, if any
             
         Returns:
-            List of dicts with 'text' and 'source'
+            List of retrieved contexts
         """
         # Generate embedding for the question
-        question_embedding = self.embedding_model.encode(
-            question,
-            convert_to_numpy=True
-        )
+        if question_embedding is None:
+            question_embedding = self.embed_question(question)
         
-        # Query ChromaDB
+        return self.retrieve_contexts(question_embedding[np.newaxis, :], top_k)[0]
+    
+    def retrieve_contexts(
+        self,
+        question_embeddings: np.ndarray,
+        top_k: int = TOP_K_RESULTS
+    ) -> List[List[Context]]:
+        """
+        Retrieve context chunks for several questions in one vector search.
+        
+        Args:
+            question_embeddings: Array of shape (n_questions, dim)
+            top_k: Number of top results to retrieve per question
+            
+        Returns:
+            One list of retrieved contexts per question
+        """
+        # Query ChromaDB; numpy arrays are passed as-is, with no Python
+        # list conversion, and all questions share one HNSW batch search
         results = self.collection.query(
-            query_embeddings=[question_embedding.tolist()],
+            query_embeddings=question_embeddings,
             n_results=top_k
         )
         
         # Format results
-        contexts = []
-        if results['documents'] and results['documents'][0]:
-            for doc, metadata in zip(results['documents'][0], results['metadatas'][0]):
-                contexts.append({
-                    "text": doc,
-                    "source": metadata.get("source", "unknown")
-                })
-        print(contexts)
-        return contexts
+        all_contexts = []
+        for i in range(len(question_embeddings)):
+            contexts = []
+            if results['documents'] and results['documents'][i]:
+                for doc, metadata in zip(results['documents'][i], results['metadatas'][i]):
+                    contexts.append(Context(
+                        text=doc,
+                        source=metadata.get("source", "unknown")
+                    ))
+            logger.debug("Retrieved %d contexts", len(contexts))
+            all_contexts.append(contexts)
+        
+        return all_contexts
     
-    def build_prompt(self, question: str, contexts: List[Dict]) -> str:
+    def build_prompt(self, question: str, contexts: List[Context]) -> str:
         """
         Build a strict, structured prompt for the LLM.
         
@@ -117,33 +372,16 @@ class VascoRAG:
         Returns:
             Formatted prompt string
         """
-        # Build context section
-        context_text = "\n\n".join([
-            f"[Source: {ctx['source']}]\n{ctx['text']}"
-            for ctx in contexts
-        ])
-        
-        prompt = f"""You are a helpful assistant answering questions about Clube de Regatas Vasco da Gama.
-
-CRITICAL INSTRUCTIONS:
-1. You MUST answer ONLY using the context provided below
-2. The context below is AUTHORITATIVE and is the ONLY source of truth
-3. DO NOT use any external knowledge or information you were trained on
-4. DO NOT guess or make assumptions
-5. If the answer is not explicitly present in the context, you MUST respond with "I don't know"
-6. Keep your answers concise and factual
-7. When you provide an answer, cite which source document it came from
-
-CONTEXT:
-{context_text}
-
-QUESTION: {question}
-
-ANSWER:"""
-        
-        return prompt
+        return "".join((
+            _PROMPT_PREFIX,
+            "\n\n".join(
+                f"[Source: {ctx.source}]\n{ctx.text}"
+                for ctx in contexts
+            ),
+            _PROMPT_SUFFIX.format(question=question)
+        ))
     
-    def call_ollama(self, prompt: str) -> str:
+    async def call_ollama(self, prompt: str) -> str:
         """
         Call Ollama API to generate an answer.
         
@@ -157,40 +395,79 @@ ANSWER:"""
             ConnectionError: If Ollama is not running
             ValueError: If the model is not available
         """
-        url = f"{OLLAMA_BASE_URL}/api/generate"
-        
-        payload = {
-            "model": self.ollama_model,
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.1,  # Low temperature for factual responses
-                "top_p": 0.9,
-                "top_k": 40
-            }
-        }
-        
         try:
-            response = requests.post(url, json=payload, timeout=60)
+            async with self._ollama_slots:
+                response = await self.http_client.post(
+                    "/api/generate",
+                    content=self._ollama_body(prompt, stream=False)
+                )
             response.raise_for_status()
             
-            result = response.json()
+            result = orjson.loads(response.content)
             return result.get("response", "").strip()
             
-        except requests.exceptions.ConnectionError:
-            raise ConnectionError(
+        except httpx.HTTPError as e:
+            raise self._ollama_error(e)
+    
+    async def stream_ollama(self, prompt: str) -> AsyncGenerator[str, None]:
+        """
+        Call Ollama API and yield the answer as it is generated.
+        
+        Args:
+            prompt: The complete prompt with context and question
+            
+        Yields:
+            Pieces of the generated answer
+            
+        Raises:
+            ConnectionError: If Ollama is not running
+            ValueError: If the model is not available
+        """
+        try:
+            async with self._ollama_slots, self.http_client.stream(
+                "POST",
+                "/api/generate",
+                content=self._ollama_body(prompt, stream=True)
+            ) as response:
+                response.raise_for_status()
+                
+                # Ollama streams one JSON object per line
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    result = orjson.loads(line)
+                    if result.get("response"):
+                        yield result["response"]
+                    if result.get("done"):
+                        break
+                        
+        except httpx.HTTPError as e:
+            raise self._ollama_error(e)
+    
+    def _ollama_body(self, prompt: str, stream: bool) -> bytes:
+        """Serialize the request body for Ollama's generate endpoint."""
+        return orjson.dumps({
+            "model": self.ollama_model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": _OLLAMA_OPTIONS
+        })
+    
+    def _ollama_error(self, e: httpx.HTTPError) -> Exception:
+        """Map an httpx error to the errors documented by call_ollama."""
+        if isinstance(e, httpx.ConnectError):
+            return ConnectionError(
                 f"Could not connect to Ollama at {OLLAMA_BASE_URL}. "
                 "Please ensure Ollama is running locally."
             )
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                raise ValueError(
-                    f"Model '{self.ollama_model}' not found. "
-                    f"Please pull the model first: ollama pull {self.ollama_model}"
-                )
-            raise
+        if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 404:
+            return ValueError(
+                f"Model '{self.ollama_model}' not found. "
+                f"Please pull the model first: ollama pull {self.ollama_model}"
+            )
+        return e
     
-    def ask(self, question: str) -> Dict[str, any]:
+    async def ask(self, question: str) -> AskResult:
         """
         Main entry point: answer a question using RAG.
         
@@ -200,28 +477,201 @@ ANSWER:"""
         Returns:
             Dict with 'answer' and 'sources'
         """
-        # Step 1: Retrieve relevant context
-        contexts = self.retrieve_context(question)
+        results = await self.ask_batch([question])
+        return results[0]
+    
+    @overload
+    async def ask_batch(
+        self,
+        questions: List[str],
+        return_exceptions: Literal[False] = ...
+    ) -> List[AskResult]: ...
+    
+    @overload
+    async def ask_batch(
+        self,
+        questions: List[str],
+        return_exceptions: Literal[True]
+    ) -> List[Union[AskResult, BaseException]]: ...
+    
+    async def ask_batch(
+        self,
+        questions: List[str],
+        return_exceptions: bool = False
+    ) -> Sequence[Union[AskResult, BaseException]]:
+        """
+        Answer several questions at once.
         
-        if not contexts:
-            return {
-                "answer": "I don't know",
-                "sources": []
-            }
+        All questions are embedded in one forward pass and retrieved in one
+        vector search; the Ollama generations then run concurrently, at most
+        ollama_parallel at a time. Embedding and vector search are blocking,
+        so they run in a worker thread to keep the event loop free for other
+        requests.
+        
+        Args:
+            questions: User questions
+            return_exceptions: Return a failed generation's exception in
+                place of its answer instead of raising it
+            
+        Returns:
+            One dict with 'answer' and 'sources' per question, in order
+        """
+        prepared = await self._prepare(questions)
         
-        # Step 2: Build strict prompt
-        prompt = self.build_prompt(question, contexts)
+        # Steps 3-4: Generate the answers concurrently
+        answers = iter(await asyncio.gather(*(
+            self._generate(item) for item in prepared
+            if isinstance(item, _PendingAnswer)
+        ), return_exceptions=True))
         
-        # Step 3: Generate answer
-        answer = self.call_ollama(prompt)
+        results: List[Union[AskResult, BaseException]] = []
+        for item in prepared:
+            result = next(answers) if isinstance(item, _PendingAnswer) else item
+            if isinstance(result, BaseException) and not return_exceptions:
+                raise result
+            results.append(result)
         
-        # Step 4: Extract unique sources
-        sources = list(set([ctx["source"] for ctx in contexts]))
+        return results
+    
+    async def ask_stream(
+        self,
+        question: str
+    ) -> AsyncGenerator[StreamEvent, None]:
+        """
+        Answer a question using RAG, streaming the answer as it is generated.
+        
+        The first event carries the sources and is only produced once Ollama
+        has started answering, so connection and model errors are raised
+        before anything is yielded. The following events carry pieces of the
+        answer.
+        
+        Args:
+            question: User's question
+            
+        Yields:
+            {'sources': [...]} once, then {'answer': '...'} pieces
+            
+        Raises:
+            ConnectionError: If Ollama is not running
+            ValueError: If the model is not available
+        """
+        prepared = (await self._prepare([question]))[0]
+        if not isinstance(prepared, _PendingAnswer):
+            yield {"sources": prepared["sources"]}
+            yield {"answer": prepared["answer"]}
+            return
+        
+        # Step 3: Stream the answer, waiting for the first piece before
+        # yielding anything so that Ollama errors surface to the caller
+        pieces = self.stream_ollama(prepared.prompt)
+        try:
+            first = await anext(pieces, "")
+            yield {"sources": prepared.sources}
+            
+            answer = [first]
+            if first:
+                yield {"answer": first}
+            async for piece in pieces:
+                answer.append(piece)
+                yield {"answer": piece}
+        finally:
+            await pieces.aclose()
+        
+        # Step 4: Cache the complete answer
+        self._finish(prepared, "".join(answer).strip())
+    
+    async def _prepare(
+        self,
+        questions: List[str]
+    ) -> List[Union[AskResult, _PendingAnswer]]:
+        """
+        Run the steps shared by every answer path up to generation.
+        
+        Returns, per question, either a final answer (a cache hit, or
+        "I don't know" when nothing was retrieved) or the prompt and
+        sources still to be generated.
+        """
+        # Step 0: Serve repeated or near-duplicate questions from the cache
+        embeddings = await asyncio.to_thread(self.embed_questions, questions)
+        cached = [self.cache.lookup(embedding) for embedding in embeddings]
+        misses = [i for i, hit in enumerate(cached) if hit is None]
+        
+        # Step 1: Retrieve relevant context
+        retrieved: Dict[int, List[Context]] = {}
+        if misses:
+            all_contexts = await asyncio.to_thread(
+                self.retrieve_contexts,
+                embeddings[misses]
+            )
+            retrieved = dict(zip(misses, all_contexts))
+        
+        prepared: List[Union[AskResult, _PendingAnswer]] = []
+        for i, hit in enumerate(cached):
+            if hit is not None:
+                prepared.append(hit)
+                continue
+            
+            contexts = retrieved[i]
+            if not contexts:
+                prepared.append({
+                    "answer": "I don't know",
+                    "sources": []
+                })
+                continue
+            
+            # Step 2: Build strict prompt and extract unique sources,
+            # in retrieval order
+            prepared.append(_PendingAnswer(
+                question_embedding=embeddings[i],
+                prompt=self.build_prompt(questions[i], contexts),
+                sources=list(dict.fromkeys(ctx.source for ctx in contexts))
+            ))
+        
+        return prepared
+    
+    async def _generate(self, pending: _PendingAnswer) -> AskResult:
+        """Generate and cache the answer for a prepared question."""
+        answer = await self.call_ollama(pending.prompt)
+        return self._finish(pending, answer)
+    
+    def _finish(self, pending: _PendingAnswer, answer: str) -> AskResult:
+        """Cache a generated answer, unless Ollama returned nothing."""
+        if answer:
+            self.cache.store(pending.question_embedding, {
+                "answer": answer,
+                "sources": pending.sources
+            })
         
         return {
             "answer": answer,
-            "sources": sources
+            "sources": list(pending.sources)
         }
+    
+    async def warmup_ollama(self) -> None:
+        """
+        Ask Ollama to load the model into memory.
+        
+        Ollama loads the model without generating anything when given an
+        empty prompt, so the first real question does not pay the load time.
+        
+        Raises:
+            ConnectionError: If Ollama is not running
+            ValueError: If the model is not available
+        """
+        await self.call_ollama("")
+    
+    async def aclose(self) -> None:
+        """Close pooled connections to Ollama."""
+        await self.http_client.aclose()
+
+
+async def _ask_once(question: str) -> AskResult:
+    """Answer a single question and release the HTTP client."""
+    rag = VascoRAG()
+    try:
+        return await rag.ask(question)
+    finally:
+        await rag.aclose()
 
 
 def main():
@@ -239,8 +689,7 @@ def main():
     
     print(f"Question: {question}\n")
     
-    rag = VascoRAG()
-    result = rag.ask(question)
+    result = asyncio.run(_ask_once(question))
     
     print(f"Answer: {result['answer']}\n")
     print(f"Sources: {', '.join(result['sources'])}")
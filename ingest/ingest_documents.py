@@ -12,11 +12,9 @@ Run this script whenever you add or update knowledge documents.
 
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Dict
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 
 
 # Configuration
@@ -26,6 +24,11 @@ COLLECTION_NAME = "vasco_knowledge"
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # Fast, efficient model for local use
 CHUNK_SIZE = 500  # Characters per chunk
 CHUNK_OVERLAP = 100  # Overlap to preserve context
+EMBEDDING_BATCH_SIZE = 64  # Chunks per forward pass on CPU (doubled on GPU)
+
+# Markdown header patterns, compiled once
+_HEADER_RE = re.compile(r'(^#{1,6}\s+.+$)', re.MULTILINE)
+_HEADER_LINE_RE = re.compile(r'^#{1,6}\s+')
 
 
 class MarkdownChunker:
@@ -76,23 +79,24 @@ class MarkdownChunker:
     def _split_by_headers(self, content: str) -> List[str]:
         """Split content by Markdown headers."""
         # Split on headers (##, ###, etc.) while keeping the header with its content
-        pattern = r'(^#{1,6}\s+.+$)'
-        parts = re.split(pattern, content, flags=re.MULTILINE)
+        parts = _HEADER_RE.split(content)
         
         sections = []
-        current_section = ""
+        current_section: List[str] = []
         
         for part in parts:
-            if re.match(r'^#{1,6}\s+', part):
+            if _HEADER_LINE_RE.match(part):
                 # This is a header
-                if current_section:
-                    sections.append(current_section)
-                current_section = part + "\n"
+                section = "".join(current_section)
+                if section:
+                    sections.append(section)
+                current_section = [part, "\n"]
             else:
-                current_section += part
+                current_section.append(part)
         
-        if current_section:
-            sections.append(current_section)
+        section = "".join(current_section)
+        if section:
+            sections.append(section)
         
         return sections if sections else [content]
     
@@ -100,30 +104,59 @@ class MarkdownChunker:
         """Split large text by paragraphs, respecting chunk size."""
         paragraphs = text.split('\n\n')
         chunks = []
-        current_chunk = ""
+        # Collect pieces and join once per chunk to avoid quadratic +=
+        current_chunk: List[str] = []
+        current_len = 0
         
         for para in paragraphs:
             # If adding this paragraph exceeds chunk size, save current chunk
-            if len(current_chunk) + len(para) > self.chunk_size and current_chunk:
-                chunks.append(current_chunk)
+            if current_len + len(para) > self.chunk_size and current_len:
+                chunk = "".join(current_chunk)
+                chunks.append(chunk)
                 # Start new chunk with overlap from previous
-                current_chunk = current_chunk[-self.overlap:] + "\n\n" + para
+                overlap = chunk[-self.overlap:]
+                current_chunk = [overlap, "\n\n", para]
+                current_len = len(overlap) + 2 + len(para)
+            elif current_len:
+                current_chunk += ["\n\n", para]
+                current_len += 2 + len(para)
             else:
-                current_chunk += "\n\n" + para if current_chunk else para
+                current_chunk = [para]
+                current_len = len(para)
         
-        if current_chunk:
-            chunks.append(current_chunk)
+        if current_len:
+            chunks.append("".join(current_chunk))
         
         return chunks
 
 
+def _chunk_one(doc: Dict[str, str]) -> List[Dict[str, str]]:
+    """Chunk one loaded document; runs in a chunking worker process."""
+    return MarkdownChunker().chunk_document(doc["content"], doc["source"])
+
+
 class DocumentIngester:
     """
     Handles the complete ingestion pipeline.
+    
+    The embedding model and vector store are only loaded after chunking,
+    so the chunking worker processes neither fork that state nor, on spawn
+    platforms, import torch, chromadb and sentence-transformers.
     """
     
     def __init__(self):
-        self.chunker = MarkdownChunker()
+        self.embedding_model = None
+        self.client = None
+        self.collection = None
+    
+    def _open_vectorstore(self):
+        """Load the embedding model and reset the ChromaDB collection."""
+        # Imported here rather than at module level, since spawned chunking
+        # workers re-import this script
+        import chromadb
+        from chromadb.config import Settings
+        from sentence_transformers import SentenceTransformer
+        
         self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
         
         # Initialize ChromaDB with persistent storage
@@ -144,7 +177,10 @@ class DocumentIngester:
         
         self.collection = self.client.create_collection(
             name=COLLECTION_NAME,
-            metadata={"description": "Vasco da Gama knowledge base"}
+            metadata={
+                "description": "Vasco da Gama knowledge base",
+                "hnsw:space": "cosine"
+            }
         )
     
     def load_markdown_files(self) -> List[Dict[str, str]]:
@@ -178,8 +214,9 @@ class DocumentIngester:
         
         1. Load documents
         2. Chunk them
-        3. Generate embeddings
-        4. Store in ChromaDB
+        3. Load the embedding model and vector store
+        4. Generate embeddings
+        5. Store in ChromaDB
         """
         print("Starting ingestion pipeline...")
         print(f"Data directory: {DATA_DIR}")
@@ -190,30 +227,46 @@ class DocumentIngester:
         documents = self.load_markdown_files()
         print()
         
-        # Chunk all documents
+        # Chunk all documents, one process per core (chunking is pure
+        # Python string work, so threads would serialize on the GIL)
+        workers = min(len(documents), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunked = list(pool.map(_chunk_one, documents))
+        
         all_chunks = []
-        for doc in documents:
-            chunks = self.chunker.chunk_document(doc["content"], doc["source"])
+        for doc, chunks in zip(documents, chunked):
             all_chunks.extend(chunks)
             print(f"Chunked {doc['source']}: {len(chunks)} chunks")
         
         print(f"\nTotal chunks: {len(all_chunks)}")
         print()
         
+        # Load the model and vector store now that chunking is done
+        self._open_vectorstore()
+        
         # Generate embeddings
         print("Generating embeddings...")
         texts = [chunk["text"] for chunk in all_chunks]
+        batch_size = EMBEDDING_BATCH_SIZE
+        if self.embedding_model.device.type == "cuda":
+            batch_size *= 2
+        
+        # encode() sorts texts by length internally, so each batch pads to
+        # similar lengths, and returns embeddings in the original order
         embeddings = self.embedding_model.encode(
             texts,
+            batch_size=batch_size,
             show_progress_bar=True,
-            convert_to_numpy=True
+            convert_to_numpy=True,
+            normalize_embeddings=True
         )
         
-        # Store in ChromaDB
+        # Store in ChromaDB; encode() already returns a float32 array,
+        # which is passed as-is
         print("\nStoring in vector database...")
         self.collection.add(
             ids=[chunk["chunk_id"] for chunk in all_chunks],
-            embeddings=embeddings.tolist(),
+            embeddings=embeddings,
             documents=texts,
             metadatas=[{"source": chunk["source"]} for chunk in all_chunks]
         )